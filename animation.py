@@ -0,0 +1,73 @@
+import csv
+import json
+from array import array
+from bisect import bisect_right
+
+
+class Track(object):
+    """Keyframes for one channel, played back by linear interpolation.
+
+    Times and angles are kept in flat float arrays. A track behaves like a Trajectory, so the
+    servo scheduler can sample it on every tick alongside ordinary moves.
+    """
+
+    def __init__(self, times, angles, start=None):
+        self.times = times
+        self.angles = angles
+        self.duration = times[-1]
+        # Where the channel is when playback begins, used to ease into a first keyframe after t=0
+        self.start = start
+
+    def starting_from(self, angle):
+        return Track(self.times, self.angles, angle)
+
+    def position(self, t):
+        times = self.times
+        index = bisect_right(times, t)
+        if index == 0:
+            if self.start is None:
+                return self.angles[0]
+            return self.start + (self.angles[0] - self.start) * max(t, 0) / times[0]
+        if index == len(times):
+            return self.angles[-1]
+        t0 = times[index - 1]
+        a0 = self.angles[index - 1]
+        return a0 + (self.angles[index] - a0) * (t - t0) / (times[index] - t0)
+
+    def done(self, t):
+        return t >= self.duration
+
+
+class Timeline(object):
+    """A set of keyframe tracks, one per channel, loaded from a CSV or JSON file.
+
+    CSV files have time, channel and angle columns (with a header row); JSON files hold a list of
+    objects with the same keys. Times are in seconds from the start of the animation, channels
+    are arm names and angles are in degrees.
+    """
+
+    def __init__(self, keyframes):
+        by_channel = {}
+        for time, channel, angle in sorted(keyframes, key=lambda keyframe: (keyframe[1], keyframe[0])):
+            if time < 0:
+                raise ValueError('Keyframe times must not be negative')
+            if not 0 <= angle <= 180:
+                raise ValueError('Keyframe angles must be between 0 and 180, inclusive')
+            times, angles = by_channel.setdefault(channel, (array('d'), array('d')))
+            if times and times[-1] == time:
+                raise ValueError('Duplicate keyframe for %s at %gs' % (channel, time))
+            times.append(time)
+            angles.append(angle)
+        if not by_channel:
+            raise ValueError('Animation has no keyframes')
+        self.tracks = {channel: Track(times, angles) for channel, (times, angles) in by_channel.items()}
+        self.duration = max(track.duration for track in self.tracks.values())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as source:
+            if path.endswith('.json'):
+                rows = json.load(source)
+            else:
+                rows = csv.DictReader(source)
+            return cls([(float(row['time']), row['channel'].strip().lower(), float(row['angle'])) for row in rows])
@@ -0,0 +1,182 @@
+import asyncio
+import os
+import signal
+import struct
+import time
+from abc import ABC, abstractmethod
+
+
+def wav_pcm(data):
+    # The PCM samples of a WAV file (such as LINEAR16 output from the TTS service), or the data
+    # unchanged if it has no RIFF header
+    if data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        return data
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk, size = struct.unpack_from('<4sI', data, offset)
+        if chunk == b'data':
+            return data[offset + 8:offset + 8 + size]
+        offset += 8 + size + (size & 1)
+    raise ValueError('WAV data has no data chunk')
+
+
+class Player(ABC):
+    """Plays audio clips one after another and records how long each one took to start."""
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.start_latencies = []
+
+    async def play(self, clip, on_start=None):
+        # Clips queue up behind each other; returns once this one has finished playing.
+        # on_start is called the moment the clip starts being heard
+        async with self.lock:
+            requested = time.monotonic()
+
+            def started():
+                self.start_latencies.append(time.monotonic() - requested)
+                if on_start is not None:
+                    on_start()
+
+            await self.play_clip(clip, started)
+
+    @abstractmethod
+    async def play_clip(self, clip, started):
+        # Plays one clip, calling started() once it can be heard, and returns when it has finished
+        pass
+
+    def latency_summary(self):
+        if not self.start_latencies:
+            return 'no clips played'
+        return '%d clips, mean %.1fms, max %.1fms' % (
+                len(self.start_latencies),
+                1000 * sum(self.start_latencies) / len(self.start_latencies),
+                1000 * max(self.start_latencies))
+
+    def close(self):
+        pass
+
+
+class ProcessPlayer(Player):
+    """Keeps one long-lived player process running and feeds it clips over its stdin.
+
+    This saves forking a process and setting up the audio device for every clip. The process is
+    started on first use and restarted if it exits.
+    """
+
+    # What to do with the process's output, subclasses that read it set this to PIPE
+    stdout = asyncio.subprocess.DEVNULL
+
+    def __init__(self, executable):
+        super().__init__()
+        self.executable = executable
+        self.process = None
+
+    @abstractmethod
+    def arguments(self):
+        # Command line arguments for the player process
+        pass
+
+    async def ensure_running(self):
+        if self.process is None or self.process.returncode is not None:
+            self.process = await asyncio.create_subprocess_exec(
+                    self.executable, *self.arguments(),
+                    stdin=asyncio.subprocess.PIPE, stdout=self.stdout, stderr=asyncio.subprocess.DEVNULL)
+
+    def close(self):
+        # Runs after the event loop has shut down, so signal the process directly
+        if self.process is not None and self.process.returncode is None:
+            try:
+                os.kill(self.process.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
+class Mpg321Player(ProcessPlayer):
+    """Keeps one mpg321 running in remote control mode and has it load clips by path.
+
+    A clip has started once the player reports its first decoded frame (@F) and is over once it
+    reports that playback stopped (@P 0).
+    """
+
+    stdout = asyncio.subprocess.PIPE
+
+    def __init__(self, executable='/usr/bin/mpg321'):
+        super().__init__(executable)
+
+    def arguments(self):
+        return ['-R', 'robot']
+
+    async def play_clip(self, path, started):
+        await self.ensure_running()
+        self.process.stdin.write(b'LOAD %s\n' % path.encode('utf8'))
+        await self.process.stdin.drain()
+
+        playing = False
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                # The player died, it gets restarted for the next clip
+                break
+            if line.startswith(b'@F') and not playing:
+                playing = True
+                started()
+            elif line.startswith(b'@P 0') or line.startswith(b'@E'):
+                break
+
+
+class AplayPlayer(ProcessPlayer):
+    """Keeps one aplay running and streams raw 16 bit mono PCM clips into it.
+
+    Clips are bytes-like objects (typically memoryview slices of a PackedClipCache), written to
+    aplay's stdin as they are, with no decoding. aplay gives no feedback, so when a clip starts
+    and ends is worked out from how much audio is already queued ahead of it.
+    """
+
+    def __init__(self, sample_rate=24000, executable='/usr/bin/aplay'):
+        super().__init__(executable)
+        self.sample_rate = sample_rate
+        self.busy_until = 0.0
+
+    def arguments(self):
+        return ['-q', '-t', 'raw', '-f', 'S16_LE', '-c', '1', '-r', str(self.sample_rate)]
+
+    async def ensure_running(self):
+        process = self.process
+        await super().ensure_running()
+        if self.process is not process:
+            # Nothing is queued in a freshly started player
+            self.busy_until = 0.0
+
+    async def play_clip(self, clip, started):
+        await self.ensure_running()
+        # aplay starts on the clip as soon as it has finished what is queued ahead of it. drain()
+        # only returns once most of a long clip has been read, which is well after that
+        start = max(self.busy_until, time.monotonic())
+        self.busy_until = start + len(clip) / (2 * self.sample_rate)
+        handle = asyncio.get_event_loop().call_later(max(start - time.monotonic(), 0), started)
+        try:
+            self.process.stdin.write(clip)
+            await self.process.stdin.drain()
+        except BaseException:
+            handle.cancel()
+            raise
+        await asyncio.sleep(self.busy_until - time.monotonic())
+
+
+class FileSink(Player):
+    """Stand-in for a real player that appends every clip to a file, for running without audio
+    hardware. Clips are either paths or bytes-like PCM data."""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+    async def play_clip(self, clip, started):
+        with open(self.path, 'ab') as sink:
+            started()
+            if isinstance(clip, str):
+                with open(clip, 'rb') as source:
+                    sink.write(source.read())
+            else:
+                sink.write(clip)
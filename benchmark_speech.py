@@ -0,0 +1,57 @@
+import sys
+import tempfile
+import time
+
+from speech import PackedClipCache, SpeechCache, SpeechPool, split_utterance, synthesizers
+import commands
+
+
+# Compares how long each speech backend takes to synthesize a program's utterances, and how long
+# the same clips take to come back out of the cache afterwards.
+#
+#     python3 benchmark_speech.py programs/hokey-pokey.program [google espeak silence]
+
+
+def summary(samples):
+    samples = sorted(samples)
+    return 'mean %.1fms, p50 %.1fms, max %.1fms' % (
+            1000 * sum(samples) / len(samples),
+            1000 * samples[len(samples) // 2],
+            1000 * samples[-1])
+
+
+def benchmark(synthesizer, chunks):
+    with tempfile.TemporaryDirectory() as directory:
+        if synthesizer.encoding == 'pcm':
+            cache = PackedClipCache(directory)
+        else:
+            cache = SpeechCache(directory)
+        pool = SpeechPool(cache, synthesizer.synthesize, workers=1)
+        timings = {'synthesized': [], 'cached': []}
+        for label in ('synthesized', 'cached'):
+            for chunk in chunks:
+                started = time.monotonic()
+                pool.submit(cache.key(chunk, *synthesizer.identity), chunk).result()
+                timings[label].append(time.monotonic() - started)
+        pool.shutdown()
+    return timings
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: %s PROGRAM [BACKEND...]' % sys.argv[0])
+        sys.exit(1)
+
+    with open(sys.argv[1], 'r') as program:
+        lines = [line.strip() for line in program]
+    chunks = [chunk for text in commands.utterances(lines) for chunk in split_utterance(text)]
+    print('%d clips, %d characters' % (len(chunks), sum(len(chunk) for chunk in chunks)))
+
+    for name in sys.argv[2:] or sorted(synthesizers):
+        try:
+            timings = benchmark(synthesizers[name](), chunks)
+        except Exception as e:
+            print('%-8s unavailable (%s)' % (name, e))
+            continue
+        print('%-8s synthesized: %s' % (name, summary(timings['synthesized'])))
+        print('%-8s cached:      %s' % (name, summary(timings['cached'])))
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+from collections import OrderedDict
+
+
+class BusWorker(object):
+    """Owns the I2C bus on a dedicated thread so blocking transactions never run on the event loop.
+
+    Transactions are plain callables. Submitting one returns an asyncio future for its result.
+    Transactions that share a key coalesce while they are still pending: only the newest callable
+    runs, and every caller waiting on that key gets its result.
+    """
+
+    def __init__(self, loop=None):
+        self.loop = loop or asyncio.get_event_loop()
+        self.pending = OrderedDict()
+        self.condition = threading.Condition()
+        self.running = True
+
+        self.submitted = 0
+        self.coalesced = 0
+
+        self.thread = threading.Thread(target=self.run, name='i2c-bus', daemon=True)
+        self.thread.start()
+
+    def submit(self, fn, *args, key=None):
+        future = self.loop.create_future()
+        with self.condition:
+            if not self.running:
+                raise RuntimeError('Bus worker is closed')
+            self.submitted += 1
+            if key is None:
+                key = object()
+            if key in self.pending:
+                # Replace the stale transaction, but keep its waiters
+                self.coalesced += 1
+                _, _, futures = self.pending.pop(key)
+                futures.append(future)
+            else:
+                futures = [future]
+            self.pending[key] = (fn, args, futures)
+            self.condition.notify()
+        return future
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.pending:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                _, (fn, args, futures) = self.pending.popitem(last=False)
+
+            try:
+                result = fn(*args)
+            except Exception as e:
+                self.notify(futures, None, e)
+            else:
+                self.notify(futures, result, None)
+
+    def notify(self, futures, result, exception):
+        try:
+            self.loop.call_soon_threadsafe(self.resolve, futures, result, exception)
+        except RuntimeError:
+            # The event loop has already been closed, nobody is waiting any more
+            pass
+
+    @staticmethod
+    def resolve(futures, result, exception):
+        for future in futures:
+            if future.done():
+                continue
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+    def close(self):
+        # Finish whatever is already pending, then stop the thread
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join()
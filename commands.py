@@ -1,9 +1,12 @@
 import asyncio
+import os
 import re
 import sys
 
 import RPi.GPIO as GPIO
 
+from animation import Timeline
+
 
 def resolve_angle(text):
     if text == 'up':
@@ -18,6 +21,27 @@ def resolve_angle(text):
         raise SyntaxError('Angle must be between 0 and 180, inclusive.')
 
 
+animations = {}
+
+
+def load_animation(path):
+    # Timelines are immutable once loaded, so each file only gets parsed again once it changes
+    try:
+        modified = os.stat(path).st_mtime_ns
+    except OSError as e:
+        raise SyntaxError('Unable to load animation: %s' % e)
+    if path not in animations or animations[path][0] != modified:
+        try:
+            timeline = Timeline.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            raise SyntaxError('Unable to load animation: %s' % e)
+        unknown = set(timeline.tracks) - {'left', 'right'}
+        if unknown:
+            raise SyntaxError('Unknown animation channel: %s' % ', '.join(sorted(unknown)))
+        animations[path] = (modified, timeline)
+    return animations[path][1]
+
+
 def interpret_float(text, ensure_positive=False):
     res = float(text)
     if ensure_positive and res < 0:
@@ -25,32 +49,49 @@ def interpret_float(text, ensure_positive=False):
     return res
 
 
-move_arm = re.compile('move (left|right) arm (up|down|out|\d+)')
-move_arms = re.compile('move both arms (up|down|out|\d+)')
+move_arm = re.compile('move (left|right) arm (up|down|out|\d+)(?: in (.+))?')
+move_arms = re.compile('move both arms (up|down|out|\d+)(?: in (.+))?')
 
 set_eye = re.compile('set (left|right) eye (on|off)')
 set_both_eyes = re.compile('set both eyes (on|off)')
 set_antenna = re.compile('set (left|right) (ear|antenna) (on|off)')
 set_both_antennae = re.compile('set both (ears|antennas|antennae) (on|off)')
+set_talking_lights = re.compile('set talking lights (ears|antennas|antennae|eyes|off)')
 
 say = re.compile('say (.+)')
 
+# Matched against the command as typed, since file names are case sensitive
+play = re.compile('play (.+)', re.IGNORECASE)
+
 go = re.compile('go')
 
+stop = re.compile('stop')
+
 wait = re.compile('wait (.+)')
 
 
-def parse(command, robot):
+def resolve_duration(text):
+    if text is None:
+        return None
+    try:
+        return interpret_float(text, ensure_positive=True)
+    except ValueError:
+        raise SyntaxError('Move time is not valid')
+
+
+def parse(line, robot):
+    command = line.lower()
+
     match = move_arm.fullmatch(command)
     if match:
-        return [robot.move_arm(match.group(1), resolve_angle(match.group(2)))]
+        return [robot.move_arm(match.group(1), resolve_angle(match.group(2)), resolve_duration(match.group(3)))]
 
     match = move_arms.fullmatch(command)
     if match:
-        return [
-                robot.move_arm('left', resolve_angle(match.group(1))),
-                robot.move_arm('right', resolve_angle(match.group(1)))
-                ]
+        return [robot.move_arms({
+                'left': resolve_angle(match.group(1)),
+                'right': resolve_angle(match.group(1))
+                }, resolve_duration(match.group(2)))]
 
     match = set_eye.fullmatch(command)
     if match:
@@ -74,14 +115,27 @@ def parse(command, robot):
                 robot.set_antenna_state('right', GPIO.HIGH if match.group(2) == 'on' else GPIO.LOW)
                 ]
 
+    match = set_talking_lights.fullmatch(command)
+    if match:
+        lights = match.group(1)
+        return [robot.set_talking_lights(None if lights == 'off' else 'eyes' if lights == 'eyes' else 'antennae')]
+
     match = say.fullmatch(command)
     if match:
         return [robot.say(match.group(1))]
 
+    match = play.fullmatch(line)
+    if match:
+        return [robot.play(load_animation(match.group(1)))]
+
     match = go.fullmatch(command)
     if match:
         return [robot.move(0, 1, 3)]
 
+    match = stop.fullmatch(command)
+    if match:
+        return [robot.stop()]
+
     match = wait.fullmatch(command)
     if match:
         try:
@@ -92,6 +146,24 @@ def parse(command, robot):
     raise SyntaxError('Unable to parse command')
 
 
+def is_motion(line):
+    # Arm motions preempt each other and stop overrides any drive command, so none of them need
+    # to wait their turn in the queue
+    command = line.lower()
+    return bool(move_arm.fullmatch(command) or move_arms.fullmatch(command) or play.fullmatch(command)
+            or stop.fullmatch(command))
+
+
+def utterances(lines):
+    # Every distinct piece of text a program says, in order of first appearance
+    texts = []
+    for line in lines:
+        match = say.fullmatch(line.lower())
+        if match and match.group(1) not in texts:
+            texts.append(match.group(1))
+    return texts
+
+
 def process_program(lines, robot):
     action_list = []
     current_line = 0
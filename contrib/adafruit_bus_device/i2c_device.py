@@ -28,6 +28,68 @@
 __version__ = "0.0.0-auto.0"
 __repo__ = "https://github.com/adafruit/Adafruit_CircuitPython_BusDevice.git"
 
+import threading
+import time
+
+class LockHistogram:
+    """
+    Histogram of durations with power-of-two microsecond buckets. Bucket ``n`` counts durations
+    of at least ``2**(n-1)`` and less than ``2**n`` microseconds; bucket 0 counts durations under
+    one microsecond.
+    """
+    def __init__(self):
+        self.buckets = [0] * 32
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        """Add one duration, in seconds."""
+        bucket = min(int(seconds * 1000000).bit_length(), len(self.buckets) - 1)
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        """Upper bound in seconds of the bucket holding the given fraction of all durations."""
+        if not self.count:
+            return 0.0
+        threshold = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= threshold:
+                return (1 << bucket) / 1000000
+        return self.max
+
+    def __str__(self):
+        if not self.count:
+            return "no samples"
+        return "n=%d mean=%.1fus p50<%dus p99<%dus max=%.1fus" % (
+            self.count, 1000000 * self.total / self.count, 1000000 * self.percentile(0.5),
+            1000000 * self.percentile(0.99), 1000000 * self.max)
+
+class LockStats:
+    """Bus lock wait and hold time histograms for one device address."""
+    def __init__(self):
+        self.wait = LockHistogram()
+        self.hold = LockHistogram()
+        self.timeouts = 0
+
+lock_stats = {}
+"""`LockStats` for every device address that has used the bus, keyed by address."""
+
+_bus_conditions = {}
+_bus_conditions_lock = threading.Lock()
+
+def _bus_condition(i2c):
+    with _bus_conditions_lock:
+        if id(i2c) not in _bus_conditions:
+            _bus_conditions[id(i2c)] = threading.Condition()
+        return _bus_conditions[id(i2c)]
+
 class I2CDevice:
     """
     Represents a single I2C device and manages locking the bus and the device
@@ -35,6 +97,10 @@ class I2CDevice:
 
     :param ~busio.I2C i2c: The I2C bus the device is on
     :param int device_address: The 7 bit device address
+    :param bool blocking: If true, threads waiting for the bus sleep until it is released instead
+      of spinning on ``try_lock``
+    :param float timeout: In blocking mode, the number of seconds to wait for the bus before
+      raising `TimeoutError`. ``None`` waits forever.
 
     .. note:: This class is **NOT** built into CircuitPython. See
       :ref:`here for install instructions <bus_device_installation>`.
@@ -56,19 +122,23 @@ class I2CDevice:
             with device:
                 device.write(bytes_read)
     """
-    def __init__(self, i2c, device_address):
-        # Verify that a device with that address exists.
-        while not i2c.try_lock():
-            pass
-        try:
-            i2c.writeto(device_address, b'')
-        except OSError:
-            raise ValueError("No I2C device at address: %x" % device_address)
-        finally:
-            i2c.unlock()
-
+    def __init__(self, i2c, device_address, *, blocking=False, timeout=None):
         self.i2c = i2c
         self.device_address = device_address
+        self.blocking = blocking
+        self.timeout = timeout
+        self._condition = _bus_condition(i2c) if blocking else None
+        self._locked_at = 0.0
+        if device_address not in lock_stats:
+            lock_stats[device_address] = LockStats()
+        self.lock_stats = lock_stats[device_address]
+
+        # Verify that a device with that address exists.
+        with self:
+            try:
+                i2c.writeto(device_address, b'')
+            except OSError:
+                raise ValueError("No I2C device at address: %x" % device_address)
 
     def readinto(self, buf, **kwargs):
         """
@@ -144,11 +214,36 @@ class I2CDevice:
 
 #pylint: enable-msg=too-many-arguments
 
+    def _wait_for_lock(self, started):
+        with self._condition:
+            while not self.i2c.try_lock():
+                # Wake up now and then even without a notification, in case the bus is held by
+                # something that isn't an I2CDevice
+                wait = 0.01
+                if self.timeout is not None:
+                    remaining = started + self.timeout - time.monotonic()
+                    if remaining <= 0:
+                        self.lock_stats.timeouts += 1
+                        raise TimeoutError("Timed out waiting for I2C bus (device %x)"
+                                           % self.device_address)
+                    wait = min(wait, remaining)
+                self._condition.wait(wait)
+
     def __enter__(self):
-        while not self.i2c.try_lock():
-            pass
+        started = time.monotonic()
+        if self.blocking:
+            self._wait_for_lock(started)
+        else:
+            while not self.i2c.try_lock():
+                pass
+        self._locked_at = time.monotonic()
+        self.lock_stats.wait.record(self._locked_at - started)
         return self
 
     def __exit__(self, *exc):
+        self.lock_stats.hold.record(time.monotonic() - self._locked_at)
         self.i2c.unlock()
+        if self.blocking:
+            with self._condition:
+                self._condition.notify()
         return False
@@ -51,12 +51,24 @@ Implementation Notes
 __version__ = "0.0.0-auto.0"
 __repo__ = "https://github.com/adafruit/Adafruit_CircuitPython_PCA9685.git"
 
+import struct
+import threading
 import time
 
 from adafruit_register.i2c_struct import UnaryStruct
 from adafruit_register.i2c_struct_array import StructArray
 from adafruit_bus_device import i2c_device
 
+_PWM_STRUCT = struct.Struct('<HH')
+
+def _duty_cycle(pwm):
+    """Decode ``(on, off)`` counts, as the driver writes them, into a 16 bit duty cycle."""
+    if pwm[0] & 0x1000:
+        return 0xffff
+    if pwm[1] & 0x1000:
+        return 0
+    return pwm[1] << 4
+
 class PWMChannel:
     """A single PCA9685 channel that matches the :py:class:`~pulseio.PWMOut` API."""
     def __init__(self, pca, index):
@@ -77,11 +89,9 @@ class PWMChannel:
     @property
     def duty_cycle(self):
         """16 bit value that dictates how much of one cycle is high (1) versus low (0). 0xffff will
-           always be high, 0 will always be low and 0x7fff will be half high and then half low."""
-        pwm = self._pca.pwm_regs[self._index]
-        if pwm[0] == 0x1000:
-            return 0xffff
-        return pwm[1] << 4
+           always be high, 0 will always be low and 0x7fff will be half high and then half low.
+           Reads are served from the PCA9685's shadow registers and never touch the bus."""
+        return _duty_cycle(self._pca.get_pwm(self._index))
 
     @duty_cycle.setter
     def duty_cycle(self, value):
@@ -89,11 +99,21 @@ class PWMChannel:
             raise ValueError("Out of range")
 
         if value == 0xffff:
-            self._pca.pwm_regs[self._index] = (0x1000, 0)
+            self._pca.set_pwm(self._index, 0x1000, 0)
         else:
             # Shift our value by four because the PCA9685 is only 12 bits but our value is 16
             value = (value + 1) >> 4
-            self._pca.pwm_regs[self._index] = (0, value)
+            self._pca.set_pwm(self._index, 0, value)
+
+    @property
+    def counts(self):
+        """The raw 12 bit ``(on, off)`` counts of the channel, bypassing the 16 bit duty cycle
+        conversion."""
+        return self._pca.get_pwm(self._index)
+
+    @counts.setter
+    def counts(self, value):
+        self._pca.set_pwm(self._index, *value)
 
 class PCAChannels: # pylint: disable=too-few-public-methods
     """Lazily creates and caches channel objects as needed. Treat it like a sequence."""
@@ -109,6 +129,52 @@ class PCAChannels: # pylint: disable=too-few-public-methods
             self._channels[index] = PWMChannel(self._pca, index)
         return self._channels[index]
 
+class PCASnapshot:
+    """Register contents read back from the chip by `PCA9685.snapshot`."""
+    def __init__(self, mode1, prescale, pwm, reference_clock_speed):
+        self.mode1 = mode1
+        """The MODE1 register."""
+        self.prescale = prescale
+        """The PRE_SCALE register."""
+        self.pwm = pwm
+        """List of ``(on, off)`` counts, one for each channel."""
+        self.reference_clock_speed = reference_clock_speed
+
+    @property
+    def frequency(self):
+        """The PWM frequency in Hertz the chip was running at."""
+        return self.reference_clock_speed / 4096 / self.prescale
+
+    @property
+    def duty_cycles(self):
+        """List of 16 bit duty cycles, one for each channel, as `PWMChannel.duty_cycle` reports
+        them."""
+        return [_duty_cycle(pwm) for pwm in self.pwm]
+
+    def pulse_width(self, index):
+        """The high time of channel ``index`` in microseconds, or ``None`` if the channel is fully
+        off or fully on (neither of which drives a servo)."""
+        duty_cycle = _duty_cycle(self.pwm[index])
+        if duty_cycle in (0, 0xffff):
+            return None
+        return duty_cycle / 0xffff * 1000000 / self.frequency
+
+class PCAFrame:
+    """Stages channel writes while entered and commits them as one burst on exit. Frames may be
+    nested; only the outermost one commits. See `PCA9685.frame`."""
+    def __init__(self, pca, commit=True):
+        self._pca = pca
+        self._commit = commit
+
+    def __enter__(self):
+        self._pca._frame_depth += 1 # pylint: disable=protected-access
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self._pca._frame_depth -= 1 # pylint: disable=protected-access
+        if not self._pca._frame_depth and self._commit: # pylint: disable=protected-access
+            self._pca.commit()
+
 class PCA9685:
     """
     Initialise the PCA9685 chip at ``address`` on ``i2c_bus``.
@@ -121,40 +187,170 @@ class PCA9685:
     :param ~busio.I2C i2c_bus: The I2C bus which the PCA9685 is connected to.
     :param int address: The I2C address of the PCA9685.
     :param int reference_clock_speed: The frequency of the internal reference clock in Hertz.
+    :param bool blocking_lock: Sleep rather than spin while waiting for the I2C bus.
+    :param float lock_timeout: Seconds to wait for the I2C bus when ``blocking_lock`` is set.
+
+    .. note:: The driver keeps an in-memory shadow of the mode, prescale and PWM registers. Reads
+      are served from the shadow, so anything else writing to the chip must be followed by a call
+      to `resync`.
     """
     # Registers:
     mode1_reg = UnaryStruct(0x00, '<B')
     prescale_reg = UnaryStruct(0xFE, '<B')
     pwm_regs = StructArray(0x06, '<HH', 16)
 
-    def __init__(self, i2c_bus, *, address=0x40, reference_clock_speed=25000000):
-        self.i2c_device = i2c_device.I2CDevice(i2c_bus, address)
+    def __init__(self, i2c_bus, *, address=0x40, reference_clock_speed=25000000,
+                 blocking_lock=False, lock_timeout=None):
+        self.i2c_device = i2c_device.I2CDevice(i2c_bus, address, blocking=blocking_lock,
+                                               timeout=lock_timeout)
         self.channels = PCAChannels(self)
         """Sequence of 16 `PWMChannel` objects. One for each channel."""
         self.reference_clock_speed = reference_clock_speed
         """The reference clock speed in Hz."""
+        self._mode1 = 0
+        self._prescale = 0
+        self._pwm = [(0, 0)] * len(self.channels)
+        self._staged = {}
+        self._staged_lock = threading.Lock()
+        self._frame_depth = 0
+        self._frame_buffer = bytearray(1 + 4 * len(self.channels))
+        self.writes_issued = 0
+        """Number of channel writes sent (or staged) to the chip."""
+        self.writes_elided = 0
+        """Number of channel writes skipped because the chip already held the value."""
         self.reset()
+        self.initial_snapshot = self.resync()
+        """`PCASnapshot` taken when the driver started. Its PWM and prescale registers are as the
+        previous user of the chip left them."""
 
     def reset(self):
         """Reset the chip."""
-        self.mode1_reg = 0x00 # Mode1
+        self.mode1 = 0x00 # Mode1
+
+    def snapshot(self):
+        """Read MODE1, PRE_SCALE and all 64 LED_ON/LED_OFF bytes back from the chip, the latter in
+        a single burst, and return them as a `PCASnapshot`. Register auto-increment is switched on
+        for the burst if it isn't already."""
+        mode1 = self.mode1_reg & 0x7F
+        prescale = self.prescale_reg
+        if not mode1 & 0x20:
+            self.mode1_reg = mode1 | 0x20
+        buf = bytearray(4 * len(self.channels))
+        with self.i2c_device:
+            self.i2c_device.write_then_readinto(b'\x06', buf, stop=False) # LED0_ON_L
+        if not mode1 & 0x20:
+            self.mode1_reg = mode1
+        pwm = [_PWM_STRUCT.unpack_from(buf, 4 * index) for index in range(len(self.channels))]
+        return PCASnapshot(mode1, prescale, pwm, self.reference_clock_speed)
+
+    def resync(self):
+        """Reload the shadow registers from the chip. Returns the `PCASnapshot` they were loaded
+        from."""
+        snapshot = self.snapshot()
+        self._mode1 = snapshot.mode1
+        self._prescale = snapshot.prescale
+        self._pwm[:] = snapshot.pwm
+        return snapshot
+
+    @property
+    def mode1(self):
+        """The MODE1 register, as last written to or read from the chip."""
+        return self._mode1
+
+    @mode1.setter
+    def mode1(self, value):
+        self.mode1_reg = value
+        # The RESTART bit clears itself once written, so don't keep it in the shadow
+        self._mode1 = value & 0x7F
+
+    @property
+    def prescale(self):
+        """The PRE_SCALE register, as last written to or read from the chip."""
+        return self._prescale
+
+    @prescale.setter
+    def prescale(self, value):
+        self.prescale_reg = value
+        self._prescale = value
+
+    def get_pwm(self, index):
+        """The ``(on, off)`` counts of channel ``index``, as last written to or read from the
+        chip."""
+        return self._pwm[index]
+
+    def set_pwm(self, index, on, off):
+        """Write the ``(on, off)`` counts of channel ``index``. Inside a `frame` the write is
+        staged until the frame commits. Writes of the value last written are skipped."""
+        if self._pwm[index] == (on, off):
+            self.writes_elided += 1
+            return
+        self.writes_issued += 1
+        self._pwm[index] = (on, off)
+        with self._staged_lock:
+            if self._frame_depth:
+                self._staged[index] = (on, off)
+                return
+            self._staged.pop(index, None)
+        self.pwm_regs[index] = (on, off)
+
+    def frame(self, commit=True):
+        """Context manager that stages every channel write made inside it and commits them all
+        together on exit, so a multi-servo pose lands within the same PWM period:
+
+        .. code-block:: python
+
+            with pca.frame():
+                pca.channels[0].duty_cycle = 0x1000
+                pca.channels[1].duty_cycle = 0x2000
+
+        With ``commit=False`` the staged writes are left for an explicit call to `commit`, which
+        may happen on another thread (for example a thread that owns the bus).
+        """
+        return PCAFrame(self, commit)
+
+    def commit(self):
+        """Write all staged channels. With register auto-increment enabled this is a single
+        transaction covering the LED_ON/LED_OFF range from the lowest to the highest staged
+        channel; unstaged channels in between are rewritten from the shadow.
+
+        The staging lock is only held while the frame is packed, never during the bus transfer,
+        so `set_pwm` on another thread doesn't wait on I2C. Commits are expected to come from a
+        single thread."""
+        with self._staged_lock:
+            if not self._staged:
+                return
+            staged = self._staged
+            self._staged = {}
+            if self._mode1 & 0x20:
+                first = min(staged)
+                last = max(staged)
+                buf = self._frame_buffer
+                buf[0] = 0x06 + 4 * first # LED0_ON_L
+                for index in range(first, last + 1):
+                    _PWM_STRUCT.pack_into(buf, 1 + 4 * (index - first), *self._pwm[index])
+        if not self._mode1 & 0x20:
+            for index in sorted(staged):
+                self.pwm_regs[index] = staged[index]
+            return
+        with self.i2c_device:
+            self.i2c_device.write(buf, end=1 + 4 * (last - first + 1))
 
     @property
     def frequency(self):
         """The overall PWM frequency in Hertz."""
-        return self.reference_clock_speed / 4096 / self.prescale_reg
+        return self.reference_clock_speed / 4096 / self.prescale
 
     @frequency.setter
     def frequency(self, freq):
         prescale = int(self.reference_clock_speed / 4096.0 / freq + 0.5)
         if prescale < 3:
             raise ValueError("PCA9685 cannot output at the given frequency")
-        old_mode = self.mode1_reg # Mode 1
-        self.mode1_reg = (old_mode & 0x7F) | 0x10 # Mode 1, sleep
-        self.prescale_reg = prescale # Prescale
-        self.mode1_reg = old_mode # Mode 1
+        old_mode = self.mode1 # Mode 1
+        self.mode1 = (old_mode & 0x7F) | 0x10 # Mode 1, sleep
+        self.prescale = prescale # Prescale
+        self.mode1 = old_mode # Mode 1
         time.sleep(0.005)
-        self.mode1_reg = old_mode | 0xa1 # Mode 1, autoincrement on
+        self.mode1 = old_mode | 0xa1 # Mode 1, autoincrement on
 
     def __enter__(self):
         return self
@@ -49,18 +49,21 @@ class Struct:
     """
     def __init__(self, register_address, struct_format):
         self.format = struct_format
-        self.buffer = bytearray(1+struct.calcsize(self.format))
+        self.struct = struct.Struct(struct_format)
+        self.buffer = bytearray(1+self.struct.size)
         self.buffer[0] = register_address
 
     def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
         with obj.i2c_device:
             obj.i2c_device.write(self.buffer, end=1, stop=False)
             obj.i2c_device.readinto(self.buffer, start=1)
-        return struct.unpack_from(self.format, memoryview(self.buffer)[1:])
+            return self.struct.unpack_from(self.buffer, 1)
 
     def __set__(self, obj, value):
-        struct.pack_into(self.format, self.buffer, 1, *value)
         with obj.i2c_device:
+            self.struct.pack_into(self.buffer, 1, *value)
             obj.i2c_device.write(self.buffer)
 
 class UnaryStruct:
@@ -72,22 +75,36 @@ class UnaryStruct:
 
     :param int register_address: The register address to read the bit from
     :param type struct_format: The struct format string for this register.
+
+    The register buffer is allocated once per device object, on first access, and reused for
+    every later read and write.
     """
     def __init__(self, register_address, struct_format):
         self.format = struct_format
         self.address = register_address
+        self.struct = struct.Struct(struct_format)
+        self.buffer_id = "_unarystruct{}".format(register_address)
+
+    def _get_buffer(self, obj):
+        try:
+            return getattr(obj, self.buffer_id)
+        except AttributeError:
+            buf = bytearray(1+self.struct.size)
+            buf[0] = self.address
+            setattr(obj, self.buffer_id, buf)
+            return buf
 
     def __get__(self, obj, objtype=None):
-        buf = bytearray(1+struct.calcsize(self.format))
-        buf[0] = self.address
+        if obj is None:
+            return self
+        buf = self._get_buffer(obj)
         with obj.i2c_device:
             obj.i2c_device.write(buf, end=1, stop=False)
             obj.i2c_device.readinto(buf, start=1)
-        return struct.unpack_from(self.format, buf, 1)[0]
+            return self.struct.unpack_from(buf, 1)[0]
 
     def __set__(self, obj, value):
-        buf = bytearray(1+struct.calcsize(self.format))
-        buf[0] = self.address
-        struct.pack_into(self.format, buf, 1, value)
+        buf = self._get_buffer(obj)
         with obj.i2c_device:
+            self.struct.pack_into(buf, 1, value)
             obj.i2c_device.write(buf)
@@ -48,32 +48,33 @@ class _BoundStructArray:
     """
     def __init__(self, obj, register_address, struct_format, count):
         self.format = struct_format
+        self.struct = struct.Struct(struct_format)
         self.first_register = register_address
         self.obj = obj
         self.count = count
+        # One buffer is shared by every element and reused for every access. It is only touched
+        # while the device is locked.
+        self._buffer = bytearray(self.struct.size + 1)
 
     def _get_buffer(self, index):
-        """Shared bounds checking and buffer creation."""
+        """Shared bounds checking and buffer addressing. Only call with the device locked."""
         if not 0 <= index < self.count:
             raise IndexError()
-        size = struct.calcsize(self.format)
-        # We create the buffer every time instead of keeping the buffer (which is 32 bytes at least)
-        # around forever.
-        buf = bytearray(size + 1)
-        buf[0] = self.first_register + size * index
+        buf = self._buffer
+        buf[0] = self.first_register + self.struct.size * index
         return buf
 
     def __getitem__(self, index):
-        buf = self._get_buffer(index)
         with self.obj.i2c_device:
+            buf = self._get_buffer(index)
             self.obj.i2c_device.write(buf, end=1, stop=False)
             self.obj.i2c_device.readinto(buf, start=1)
-        return struct.unpack_from(self.format, buf, 1)  # offset=1
+            return self.struct.unpack_from(buf, 1)  # offset=1
 
     def __setitem__(self, index, value):
-        buf = self._get_buffer(index)
-        struct.pack_into(self.format, buf, 1, *value)
         with self.obj.i2c_device:
+            buf = self._get_buffer(index)
+            self.struct.pack_into(buf, 1, *value)
             self.obj.i2c_device.write(buf)
 
     def __len__(self):
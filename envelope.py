@@ -0,0 +1,81 @@
+import json
+import os
+import threading
+
+import numpy
+
+
+def envelope(pcm, sample_rate, frame=0.02):
+    # RMS loudness of raw 16 bit mono PCM for every frame seconds of audio
+    samples = numpy.frombuffer(pcm, dtype='<i2', count=len(pcm) // 2)
+    size = max(1, int(sample_rate * frame))
+    frames = samples[:len(samples) // size * size].reshape(-1, size).astype(numpy.float32)
+    return numpy.sqrt(numpy.mean(frames * frames, axis=1))
+
+
+def light_schedule(pcm, sample_rate, frame=0.02, threshold=0.3, floor=300, min_hold=0.08):
+    # Times in seconds from the start of the clip at which a light that starts off should toggle.
+    # The light is on while the loudness is above threshold times the clip's peak (and above the
+    # floor, so near-silence stays dark), and stays put for at least min_hold to avoid flicker.
+    # The schedule always ends with the light off.
+    rms = envelope(pcm, sample_rate, frame)
+    if not len(rms):
+        return []
+    on = numpy.concatenate(([False], rms > max(threshold * float(rms.max()), floor), [False]))
+    changes = (numpy.flatnonzero(numpy.diff(on)) * frame).tolist()
+
+    schedule = []
+    for on_at, off_at in zip(changes[0::2], changes[1::2]):
+        if schedule and on_at - schedule[-1] < min_hold:
+            # Bridge a short gap rather than blinking off and on again
+            schedule[-1] = off_at
+            continue
+        schedule.extend((on_at, max(off_at, on_at + min_hold)))
+    return [round(t, 3) for t in schedule]
+
+
+class LightSchedules(object):
+    """Talking light schedules for PCM speech clips, persisted as JSON next to the speech cache.
+
+    Each clip is analyzed once, by schedule(), normally straight after it has been synthesized,
+    on the speech pool's threads. Playing it back is then just a matter of looking up the saved
+    toggle times with get(). Schedules of clips the cache has evicted are dropped by prune().
+    """
+
+    def __init__(self, path, sample_rate, **options):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.options = options
+        self.lock = threading.RLock()
+        try:
+            with open(path, 'r') as schedules:
+                self.schedules = json.load(schedules)
+        except (OSError, ValueError):
+            self.schedules = {}
+
+    def get(self, key):
+        # The saved schedule, or None if the clip hasn't been analyzed yet
+        with self.lock:
+            return self.schedules.get(key)
+
+    def prune(self, keys):
+        # Forget the schedules of clips that are no longer cached
+        with self.lock:
+            self.schedules = {key: schedule for key, schedule in self.schedules.items() if key in keys}
+            self.save()
+
+    def schedule(self, key, clip):
+        with self.lock:
+            if key in self.schedules:
+                return self.schedules[key]
+        schedule = light_schedule(clip, self.sample_rate, **self.options)
+        with self.lock:
+            self.schedules[key] = schedule
+            self.save()
+        return schedule
+
+    def save(self):
+        with self.lock:
+            with open(self.path + '.tmp', 'w') as schedules:
+                json.dump(self.schedules, schedules)
+            os.replace(self.path + '.tmp', self.path)
@@ -0,0 +1,238 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+
+class SerialTransport(asyncio.WriteTransport):
+    """Non-blocking asyncio transport over an open serial port.
+
+    Writes go straight to the port's file descriptor when it can take them, and are otherwise
+    buffered and finished from a loop.add_writer callback, so the event loop never blocks on a
+    full UART buffer. The protocol is paused while the buffer is above the high watermark and
+    resumed once it falls to the low watermark. Whatever the port receives is handed to the
+    protocol's data_received.
+    """
+
+    def __init__(self, port, protocol, loop=None, high_water=64, low_water=16):
+        super().__init__()
+        self.port = port
+        self.fd = port.fileno()
+        os.set_blocking(self.fd, False)
+        self.loop = loop or asyncio.get_event_loop()
+        self.protocol = protocol
+        self.buffer = bytearray()
+        self.high_water = high_water
+        self.low_water = low_water
+        self.paused = False
+        self.closing = False
+
+        self.bytes_written = 0
+        self.bytes_queued = 0
+        self.stalls = 0
+        self.stall_time = 0.0
+        self.stalled_at = None
+
+        self.protocol.connection_made(self)
+        self.loop.add_reader(self.fd, self.on_readable)
+
+    def on_readable(self):
+        try:
+            data = os.read(self.fd, 1024)
+        except BlockingIOError:
+            return
+        if data:
+            self.protocol.data_received(data)
+
+    def get_write_buffer_size(self):
+        return len(self.buffer)
+
+    def get_write_buffer_limits(self):
+        return (self.low_water, self.high_water)
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        if high is None:
+            high = 64 if low is None else 4 * low
+        if low is None:
+            low = high // 4
+        if not 0 <= low <= high:
+            raise ValueError('high (%r) must be >= low (%r) must be >= 0' % (high, low))
+        self.high_water = high
+        self.low_water = low
+        self.update_flow_control()
+
+    def write(self, data):
+        if self.closing:
+            raise RuntimeError('Serial transport is closing')
+        if not data:
+            return
+        if not self.buffer:
+            try:
+                written = os.write(self.fd, data)
+            except BlockingIOError:
+                written = 0
+            self.bytes_written += written
+            data = data[written:]
+            if not data:
+                return
+            # The port couldn't take everything, finish the rest once it's writable again
+            self.stalls += 1
+            self.stalled_at = time.monotonic()
+            self.loop.add_writer(self.fd, self.on_writable)
+        self.buffer.extend(data)
+        self.bytes_queued += len(data)
+        self.update_flow_control()
+
+    def on_writable(self):
+        try:
+            written = os.write(self.fd, self.buffer)
+        except BlockingIOError:
+            return
+        self.bytes_written += written
+        del self.buffer[:written]
+        if not self.buffer:
+            self.loop.remove_writer(self.fd)
+            self.stall_time += time.monotonic() - self.stalled_at
+            self.stalled_at = None
+            if self.closing:
+                self.port.close()
+        self.update_flow_control()
+
+    def update_flow_control(self):
+        size = len(self.buffer)
+        if not self.paused and size > self.high_water:
+            self.paused = True
+            self.protocol.pause_writing()
+        elif self.paused and size <= self.low_water:
+            self.paused = False
+            self.protocol.resume_writing()
+
+    def can_write_eof(self):
+        return False
+
+    def is_closing(self):
+        return self.closing
+
+    def close(self):
+        # Let the buffer finish draining before the port closes
+        self.closing = True
+        self.loop.remove_reader(self.fd)
+        if not self.buffer:
+            self.port.close()
+
+    def abort(self):
+        self.closing = True
+        self.loop.remove_reader(self.fd)
+        self.loop.remove_writer(self.fd)
+        self.buffer.clear()
+        self.port.close()
+
+
+class SerialProtocol(asyncio.Protocol):
+    """Protocol side of a SerialTransport that lets writers wait for the buffer to drain."""
+
+    def __init__(self, loop=None):
+        self.loop = loop or asyncio.get_event_loop()
+        self.transport = None
+        self.paused = False
+        self.drain_waiters = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def pause_writing(self):
+        self.paused = True
+
+    def resume_writing(self):
+        self.paused = False
+        for waiter in self.drain_waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self.drain_waiters.clear()
+
+    async def drain(self):
+        if not self.paused:
+            return
+        waiter = self.loop.create_future()
+        self.drain_waiters.append(waiter)
+        await waiter
+
+
+class DriverSupervisor(SerialProtocol):
+    """Watches the health of the motor driver link.
+
+    Commands go out through write(), which notes when each command line was sent. Every line the
+    driver sends back is matched to the oldest unanswered command line to measure round-trip
+    latency. A watchdog thread, which keeps running even if the event loop stalls, sends the
+    disable command straight to the port whenever the motors are enabled and no fresh command
+    has been written within the deadline. on_trip, if given, is then called on the event loop,
+    so whatever feeds the link can forget the speeds the driver no longer has.
+    """
+
+    def __init__(self, disable_command, deadline=0.5, loop=None, samples=1000, on_trip=None):
+        super().__init__(loop)
+        self.disable_command = disable_command
+        self.deadline = deadline
+        self.on_trip = on_trip
+        self.sent_at = deque(maxlen=64)
+        self.received = bytearray()
+        self.latencies = deque(maxlen=samples)
+        self.enabled = False
+        self.last_command = time.monotonic()
+        self.trips = 0
+
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.watchdog = threading.Thread(target=self.watch, name='motor-watchdog', daemon=True)
+        self.watchdog.start()
+
+    def write(self, data):
+        now = time.monotonic()
+        with self.lock:
+            self.last_command = now
+            self.enabled = data != self.disable_command
+        for _ in range(data.count(b'\n')):
+            self.sent_at.append(now)
+        self.transport.write(data)
+
+    def get_write_buffer_size(self):
+        return self.transport.get_write_buffer_size()
+
+    def data_received(self, data):
+        now = time.monotonic()
+        self.received.extend(data)
+        lines = self.received.count(b'\n')
+        if lines:
+            del self.received[:self.received.rindex(b'\n') + 1]
+        for _ in range(lines):
+            if self.sent_at:
+                self.latencies.append(now - self.sent_at.popleft())
+
+    def latency_percentiles(self, percentiles=(50, 90, 99)):
+        samples = sorted(self.latencies)
+        if not samples:
+            return {}
+        return {p: samples[min(len(samples) - 1, int(len(samples) * p / 100))] for p in percentiles}
+
+    def watch(self):
+        while not self.closed.wait(self.deadline / 4):
+            with self.lock:
+                if not self.enabled or time.monotonic() - self.last_command < self.deadline:
+                    continue
+                self.enabled = False
+                self.trips += 1
+            try:
+                os.write(self.transport.fd, self.disable_command)
+            except OSError:
+                pass
+            if self.on_trip is not None:
+                try:
+                    self.loop.call_soon_threadsafe(self.on_trip)
+                except RuntimeError:
+                    # The event loop has already closed
+                    pass
+
+    def close(self):
+        self.closed.set()
+        self.watchdog.join()
@@ -0,0 +1,208 @@
+import asyncio
+import time
+
+
+STOP_COMMAND = b'D\r\n'
+
+# Encoded speed settings for each motor, indexed by speed in percent plus 100. Negative speeds
+# drive the motor in reverse.
+SPEED_COMMANDS = [
+        [('M%d%s%d\r\n' % (motor, 'F' if speed > 0 else 'R', abs(speed))).encode('ascii') for speed in range(-100, 101)]
+        for motor in range(2)
+        ]
+
+
+def encode_speeds(left, right):
+    # Speeds are whole percentages of full speed; the right motor is M0 and the left motor is M1
+    return SPEED_COMMANDS[0][right + 100] + SPEED_COMMANDS[1][left + 100] + b'E\r\n'
+
+
+def mix(x_vector, y_vector):
+    # Arcade drive mixing of joystick axes into (left, right) motor speeds in percent, taken
+    # from: http://home.kendra.com/mauser/joystick.html
+    v = y_vector * (2 - abs(x_vector))
+    w = x_vector * (2 - abs(y_vector))
+    L = (v - w) / 2.0
+    R = (v + w) / 2.0
+    return int(100 * L), int(100 * R)
+
+
+class MixingTable(object):
+    """Motor speeds for every quantized joystick position.
+
+    Each axis is quantized to steps levels either side of zero, and the arcade drive mixing for
+    every (x, y) cell is done once up front. Axis values inside the deadband count as zero.
+    """
+
+    def __init__(self, steps=50, deadband=0.05):
+        self.steps = steps
+        self.deadband = deadband
+        self.width = 2 * steps + 1
+        self.table = [mix(x / steps, y / steps) for y in range(-steps, steps + 1) for x in range(-steps, steps + 1)]
+
+    def quantize(self, value):
+        if abs(value) < self.deadband:
+            return self.steps
+        return min(max(int(round(value * self.steps)), -self.steps), self.steps) + self.steps
+
+    def lookup(self, x_vector, y_vector):
+        return self.table[self.quantize(y_vector) * self.width + self.quantize(x_vector)]
+
+
+class DriveController(object):
+    """Slews the motor speeds towards their targets at a limited rate.
+
+    A task ticks at a fixed interval while the speeds are ramping, moving each one at most
+    rate percent per second closer to its target and sending only the commands the ramp needs.
+    Once both motors have ramped down to zero the motors are disabled. stop() skips the ramp.
+    """
+
+    def __init__(self, writer, rate=400, interval=0.025, loop=None):
+        self.writer = writer
+        self.rate = rate
+        self.interval = interval
+        self.loop = loop or asyncio.get_event_loop()
+        self.current = (0, 0)
+        self.target = (0, 0)
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def set_target(self, left, right):
+        self.target = (left, right)
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+        self.wakeup.set()
+
+    def stop(self):
+        # Disable the motors right away instead of ramping down
+        self.target = self.current = (0, 0)
+        self.writer.submit(STOP_COMMAND)
+
+    def reset(self):
+        # The motors were disabled behind our back, so the next target ramps up from standstill
+        # and nothing resumes until a new target is set
+        self.target = self.current = (0, 0)
+
+    @staticmethod
+    def slew(current, target, step):
+        if target > current:
+            return min(current + step, target)
+        return max(current - step, target)
+
+    async def run(self):
+        last = time.monotonic() - self.interval
+        while True:
+            if self.current == self.target:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                last = time.monotonic() - self.interval
+
+            now = time.monotonic()
+            step = int(self.rate * (now - last)) or 1
+            last = now
+            left = self.slew(self.current[0], self.target[0], step)
+            right = self.slew(self.current[1], self.target[1], step)
+            self.current = (left, right)
+            self.writer.submit(encode_speeds(left, right) if left or right else STOP_COMMAND)
+            await asyncio.sleep(self.interval)
+
+    def close(self):
+        # Returns the cancelled task, which has to be awaited before the event loop closes
+        task, self.task = self.task, None
+        if task is not None:
+            task.cancel()
+        return task
+
+
+class MotorWriter(object):
+    """Sends motor driver commands with latest-value-wins semantics.
+
+    At most one command goes out per interval, and none while the previous one is still sitting
+    in the transport's write buffer. Commands submitted while the writer is waiting for the next
+    slot replace each other, so only the newest target ever reaches the driver and stale speeds
+    never queue up on the serial line. A command identical to the last one sent is dropped.
+
+    With a heartbeat interval, the last command is repeated whenever that long passes without
+    anything being sent while the motors are enabled, so a watchdog on the link can tell a robot
+    that is deliberately driving steadily from a control process that has stalled.
+    """
+
+    def __init__(self, transport, interval=0.025, heartbeat=None, loop=None):
+        self.transport = transport
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self.loop = loop or asyncio.get_event_loop()
+        self.pending = None
+        self.handle = None
+        self.heartbeat_handle = None
+        self.last_sent = float('-inf')
+        self.last_command = None
+
+        self.sent = 0
+        self.superseded = 0
+        self.suppressed = 0
+        self.heartbeats = 0
+
+    def submit(self, command):
+        if self.pending is not None:
+            self.superseded += 1
+            self.pending = None
+        if command == self.last_command:
+            self.suppressed += 1
+            return
+        self.pending = command
+        if self.handle is None:
+            delay = self.last_sent + self.interval - time.monotonic()
+            if delay <= 0:
+                self.flush()
+            else:
+                self.handle = self.loop.call_later(delay, self.flush)
+
+    def flush(self):
+        self.handle = None
+        if self.pending is None:
+            return
+        if self.transport.get_write_buffer_size():
+            # The last command hasn't left yet, try again next slot
+            self.handle = self.loop.call_later(self.interval, self.flush)
+            return
+        self.send()
+
+    def send(self):
+        command, self.pending = self.pending, None
+        self.transport.write(command)
+        self.last_command = command
+        self.last_sent = time.monotonic()
+        self.sent += 1
+
+        if self.heartbeat_handle is not None:
+            self.heartbeat_handle.cancel()
+            self.heartbeat_handle = None
+        if self.heartbeat and command != STOP_COMMAND:
+            self.heartbeat_handle = self.loop.call_later(self.heartbeat, self.beat)
+
+    def beat(self):
+        self.heartbeat_handle = None
+        if self.last_command is None:
+            return
+        if self.pending is None and self.handle is None:
+            self.heartbeats += 1
+            self.pending = self.last_command
+            self.flush()
+
+    def reset(self):
+        # The driver was disabled out of band (by a watchdog). Forget the last command so it is
+        # neither repeated by the heartbeat nor suppressed as a duplicate of a fresh submit()
+        if self.heartbeat_handle is not None:
+            self.heartbeat_handle.cancel()
+            self.heartbeat_handle = None
+        self.last_command = None
+        self.pending = None
+
+    def close(self):
+        # Stop sending, whatever is still waiting for its slot is dropped
+        for handle in (self.handle, self.heartbeat_handle):
+            if handle is not None:
+                handle.cancel()
+        self.handle = self.heartbeat_handle = None
+        self.pending = None
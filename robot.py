@@ -1,22 +1,27 @@
 import sys
+import time
 import asyncio
-import hashlib
 from pathlib import Path
 
 import RPi.GPIO as GPIO
 import serial
 
-from google.cloud import texttospeech
-
 sys.path.append('./contrib')
 import busio
-from adafruit_motor.servo import Servo
 from board import SCL, SDA
 from adafruit_pca9685 import PCA9685
 
+from audio import AplayPlayer, FileSink, Mpg321Player
+from bus import BusWorker
+from envelope import LightSchedules
 from joystick import Joystick
-from servo import InvertedServo
+from link import SerialTransport, DriverSupervisor
+from motor import STOP_COMMAND, DriveController, MixingTable, MotorWriter
+from servo import Servo, InvertedServo
+from scheduler import ServoScheduler
 from server import ControlServer
+from speech import GoogleSynthesizer, PackedClipCache, SpeechCache, SpeechPool, split_utterance, synthesizers
+from trajectory import Trajectory
 import commands
 
 
@@ -26,6 +31,39 @@ GPIO_RIGHT_EYE = 23
 GPIO_LEFT_ANTENNA = 5
 GPIO_RIGHT_ANTENNA = 6
 
+ARM_MAX_SPEED = 100  # degrees per second
+ARM_PROFILE = 'trapezoid'
+
+# A full speed command is about 20 bytes, which takes about 21ms to send at 9600 baud
+MOTOR_BAUD_RATE = 9600
+MOTOR_COMMAND_INTERVAL = 0.025
+MOTOR_AXIS_STEPS = 50
+MOTOR_DEADBAND = 0.05
+MOTOR_RAMP_RATE = 400  # percent per second
+MOTOR_HEARTBEAT_INTERVAL = 0.2
+MOTOR_WATCHDOG_DEADLINE = 0.5
+
+SPEECH_CACHE_DIRECTORY = '/tmp/speech-cache'
+SPEECH_CACHE_MAX_BYTES = 64 * 1024 * 1024
+SPEECH_SYNTHESIS_WORKERS = 4
+SPEECH_CHUNK_LENGTH = 80
+# One of speech.synthesizers: 'google', or the offline 'espeak' and 'silence'
+SPEECH_BACKEND = 'google'
+# Have Google speech cached as raw PCM in one memory-mapped pack and streamed to aplay, instead
+# of caching MP3 files that have to be decoded every time they play (the offline backends
+# always produce PCM)
+SPEECH_PCM = False
+SPEECH_SAMPLE_RATE = 24000
+# Lights that flash along with the loudness of speech: 'antennae', 'eyes' or None. Only works
+# with PCM speech, and can be changed from a program with "set talking lights ..."
+SPEECH_LIGHTS = None
+# Append all speech to this file instead of playing it, for running without audio hardware
+SPEECH_SINK = None
+TALKING_LIGHTS = {
+    'antennae': (GPIO_LEFT_ANTENNA, GPIO_RIGHT_ANTENNA),
+    'eyes': (GPIO_LEFT_EYE, GPIO_RIGHT_EYE),
+}
+
 
 class Robot:
     def __init__(self):
@@ -43,59 +81,131 @@ class Robot:
         GPIO.setup(GPIO_RIGHT_ANTENNA, GPIO.OUT, initial=GPIO.LOW)
 
         # Initialize serial port for motor driver
-        self.driver = serial.Serial('/dev/ttyS0', 9600)
+        self.driver = serial.Serial('/dev/ttyS0', MOTOR_BAUD_RATE)
+        self.driver_supervisor = DriverSupervisor(STOP_COMMAND, MOTOR_WATCHDOG_DEADLINE, on_trip=self.watchdog_tripped)
+        self.driver_link = SerialTransport(self.driver, self.driver_supervisor)
+        self.motor = MotorWriter(self.driver_supervisor, MOTOR_COMMAND_INTERVAL, MOTOR_HEARTBEAT_INTERVAL)
+        self.motor_table = MixingTable(MOTOR_AXIS_STEPS, MOTOR_DEADBAND)
+        self.drive = DriveController(self.motor, MOTOR_RAMP_RATE, MOTOR_COMMAND_INTERVAL)
 
         # Initialize the PCA9685 servo controller
-        self.pca = PCA9685(busio.I2C(SCL, SDA))
+        self.pca = PCA9685(busio.I2C(SCL, SDA), blocking_lock=True)
         self.pca.frequency = 50
 
         # Initialize the arm controls
         self.left_arm = Servo(self.pca.channels[0], min_pulse=580, max_pulse=2480)
         self.right_arm = InvertedServo(self.pca.channels[1], min_pulse=750, max_pulse=2350)
-        self.left_arm.angle = 180
-        self.right_arm.angle = 180
+
+        # From here on, all I2C traffic goes through a worker thread that owns the bus
+        self.bus = BusWorker()
+        self.servo_scheduler = ServoScheduler(self.pca, self.bus)
 
         # Initialize text to speech
-        self.speech_client = texttospeech.TextToSpeechClient()
-        self.speech_voice = texttospeech.types.VoiceSelectionParams(language_code='en-US', name="en-US-Wavenet-F")
-        self.speech_audio_config = texttospeech.types.AudioConfig(audio_encoding=texttospeech.enums.AudioEncoding.MP3)
+        if SPEECH_BACKEND == 'google':
+            self.synthesizer = GoogleSynthesizer(pcm=SPEECH_PCM, sample_rate=SPEECH_SAMPLE_RATE)
+        else:
+            self.synthesizer = synthesizers[SPEECH_BACKEND]()
+        if self.synthesizer.encoding == 'pcm':
+            self.speech_cache = PackedClipCache(SPEECH_CACHE_DIRECTORY, SPEECH_CACHE_MAX_BYTES)
+            self.light_schedules = LightSchedules(
+                    str(Path(SPEECH_CACHE_DIRECTORY) / 'lights.json'), self.synthesizer.sample_rate)
+            self.light_schedules.prune(set(self.speech_cache.index))
+            self.speech_cache.on_compact = self.light_schedules.prune
+            analyze = self.light_schedules.schedule
+        else:
+            self.speech_cache = SpeechCache(SPEECH_CACHE_DIRECTORY, SPEECH_CACHE_MAX_BYTES)
+            self.light_schedules = analyze = None
+        if SPEECH_SINK is not None:
+            self.player = FileSink(SPEECH_SINK)
+        elif self.synthesizer.encoding == 'pcm':
+            self.player = AplayPlayer(self.synthesizer.sample_rate)
+        else:
+            self.player = Mpg321Player()
+        self.speech_pool = SpeechPool(self.speech_cache, self.synthesizer.synthesize, SPEECH_SYNTHESIS_WORKERS, analyze)
+        self.choose_talking_lights(SPEECH_LIGHTS)
 
         # Initialize the master action queue
         self.action_queue = asyncio.Queue()
 
-    def locomote(self, x_vector, y_vector):
-        if x_vector or y_vector:
-            # At least one of the x-y axes is active, let's send a motor speed command and enable the motors
-
-            # Motor solutions taken from: http://home.kendra.com/mauser/joystick.html
-            v = y_vector * (2 - abs(x_vector))
-            w = x_vector * (2 - abs(y_vector))
-            L = (v - w) / 2.0
-            R = (v + w) / 2.0
-            command = 'M0%s%d\r\nM1%s%d\r\nE\r\n' % (
-                    'F' if R > 0 else 'R',
-                    abs(int(100 * R)),
-                    'F' if L > 0 else 'R',
-                    abs(int(100 * L)))
-            self.driver.write(command.encode('ascii'))
+        # Resume from wherever the last run left the arms and ease them into the initial pose,
+        # falling back to jumping there if the servos weren't being driven
+        if None in self.read_pose().values():
+            self.left_arm.angle = 180
+            self.right_arm.angle = 180
         else:
-            # No movement axes are active, disable motors
-            self.driver.write('D\r\n'.encode('ascii')) 
+            self.enqueue([self.move_arms({'left': 180, 'right': 180})])
+
+    def read_pose(self):
+        # Decode the arm angles from the register snapshot the PCA9685 driver took at startup
+        snapshot = self.pca.initial_snapshot
+        pose = {}
+        for arm_name, arm, channel in (('left', self.left_arm, 0), ('right', self.right_arm, 1)):
+            if snapshot.pulse_width(channel) is None or abs(snapshot.frequency - self.pca.frequency) > 1:
+                pose[arm_name] = None
+            else:
+                pose[arm_name] = min(max(arm.angle, 0), 180)
+        return pose
+
+    def watchdog_tripped(self):
+        # The driver has been disabled, so stay stopped until the operator asks for motion again
+        self.motor.reset()
+        self.drive.reset()
+
+    def locomote(self, x_vector, y_vector):
+        # Ramp towards the motor speeds for the x-y axes; once nothing is active any more, the
+        # motors ramp down and get disabled
+        self.drive.set_target(*self.motor_table.lookup(x_vector, y_vector))
 
     def enqueue(self, actions):
         self.action_queue.put_nowait(actions)
 
+    def perform(self, actions):
+        # Run actions right away, alongside whatever the queue is doing
+        task = asyncio.ensure_future(asyncio.gather(*actions))
+        task.add_done_callback(self.performed)
+        return task
+
+    @staticmethod
+    def performed(task):
+        # Nothing awaits an immediate action, so its failures get reported here
+        if not task.cancelled() and task.exception() is not None:
+            print('Action failed: %r' % task.exception())
+
     async def consume_queue(self):
         while True:
             actions = await self.action_queue.get()
-            await asyncio.gather(*actions)
+            try:
+                await asyncio.gather(*actions)
+            except Exception as e:
+                # One bad action mustn't stop everything queued up after it
+                print('Action failed: %r' % e)
             self.action_queue.task_done()
 
-    async def move_arm(self, arm_name, angle):
-        arm = self.left_arm if arm_name == 'left' else self.right_arm
-        while abs(arm.angle - angle) > 1:
-            arm.angle += 1 if angle > arm.angle else -1
-            await asyncio.sleep(0.01)
+    @staticmethod
+    def arm_angle(arm):
+        # The angle decoded from the registers at startup can sit a hair outside the valid range
+        return min(max(arm.angle, 0), arm.actuation_range)
+
+    async def move_arm(self, arm_name, angle, duration=None):
+        await self.move_arms({arm_name: angle}, duration)
+
+    async def move_arms(self, targets, duration=None, profile=ARM_PROFILE):
+        # Each move starts from wherever the arm is right now, so a move that preempts another
+        # one mid-flight picks up from the position it left the arm in
+        moves = []
+        for arm_name, angle in targets.items():
+            arm = self.left_arm if arm_name == 'left' else self.right_arm
+            trajectory = Trajectory(self.arm_angle(arm), angle, duration=duration, max_speed=ARM_MAX_SPEED, profile=profile)
+            moves.append(self.servo_scheduler.run(arm, trajectory))
+        await asyncio.gather(*moves)
+
+    async def play(self, timeline):
+        # Every track runs on the servo scheduler, so all channels get interpolated on the same tick
+        moves = []
+        for arm_name, track in timeline.tracks.items():
+            arm = self.left_arm if arm_name == 'left' else self.right_arm
+            moves.append(self.servo_scheduler.run(arm, track.starting_from(self.arm_angle(arm))))
+        await asyncio.gather(*moves)
 
     async def set_eye_state(self, eye, state):
         await asyncio.sleep(0.01)
@@ -105,17 +215,81 @@ class Robot:
         await asyncio.sleep(0.01)
         GPIO.output(GPIO_RIGHT_ANTENNA if antenna == 'right' else GPIO_LEFT_ANTENNA, state)
 
+    def choose_talking_lights(self, lights):
+        if lights is not None and self.light_schedules is None:
+            print('Talking lights need PCM speech, leaving them off')
+            lights = None
+        self.talking_lights = lights
+
+    async def set_talking_lights(self, lights):
+        self.choose_talking_lights(lights)
+
+    def flash_lights(self, pins, schedule):
+        # Steps through a clip's precomputed on/off schedule, starting now
+        async def run_schedule():
+            start = time.monotonic()
+            state = GPIO.LOW
+            try:
+                for toggle in schedule:
+                    await asyncio.sleep(start + toggle - time.monotonic())
+                    state = GPIO.HIGH if state == GPIO.LOW else GPIO.LOW
+                    for pin in pins:
+                        GPIO.output(pin, state)
+            finally:
+                for pin in pins:
+                    GPIO.output(pin, GPIO.LOW)
+
+        asyncio.ensure_future(run_schedule())
+
+    def speech_key(self, text):
+        return self.speech_cache.key(text, *self.synthesizer.identity)
+
+    async def prepare_speech(self, texts):
+        # Synthesize every clip that isn't cached yet, SPEECH_SYNTHESIS_WORKERS at a time.
+        # Returns how many needed synthesizing, how many of those failed and how long it all
+        # took. Failed clips are tried again (and skipped if they still fail) when they're said
+        start = time.monotonic()
+        chunks = [chunk for text in texts for chunk in split_utterance(text, SPEECH_CHUNK_LENGTH)]
+        # Every clip that has to be synthesized is exactly one cache miss; a chunk that is already
+        # in flight shares that work without checking the cache again
+        misses = self.speech_cache.misses
+        synthesis = {self.speech_pool.submit(self.speech_key(chunk), chunk) for chunk in chunks}
+        misses = self.speech_cache.misses - misses
+        results = await asyncio.gather(*[asyncio.wrap_future(future) for future in synthesis], return_exceptions=True)
+        failures = [result for result in results if isinstance(result, Exception)]
+        for failure in failures:
+            print('Unable to synthesize speech: %r' % failure)
+        return misses, len(failures), time.monotonic() - start
+
     def say(self, text):
-        cache = '/tmp/speech-%s.mp3' % hashlib.sha1(text.encode('ascii')).hexdigest()
-        speech_input = texttospeech.types.SynthesisInput(text=text)
-        response = self.speech_client.synthesize_speech(speech_input, self.speech_voice, self.speech_audio_config)
-        with open(cache, 'wb') as out:
-            out.write(response.audio_content)
+        # Long text is spoken a sentence (or clause) at a time. Every piece starts synthesizing
+        # in the background right away, and each one plays as soon as it is ready and the one
+        # before it has finished, so the first words don't wait for the whole speech
+        chunks = [(self.speech_key(chunk), chunk) for chunk in split_utterance(text, SPEECH_CHUNK_LENGTH)]
+        synthesis = [(key, asyncio.wrap_future(self.speech_pool.submit(key, chunk))) for key, chunk in chunks]
 
         async def execute_say():
-            player_exec = asyncio.create_subprocess_exec('/usr/bin/mpg321', cache, stdout=asyncio.subprocess.DEVNULL)
-            player = await player_exec
-            await player.wait()
+            for index, (key, clip) in enumerate(synthesis):
+                try:
+                    clip = await clip
+                except Exception as e:
+                    # Skip the rest of the utterance rather than failing the whole queued action.
+                    # The remaining pieces are still gathered so their errors don't go unretrieved
+                    print('Unable to synthesize speech for "%s": %r' % (text, e))
+                    asyncio.gather(*[clip for _, clip in synthesis[index + 1:]], return_exceptions=True)
+                    return
+                if self.talking_lights is None:
+                    await self.player.play(clip)
+                    continue
+                # The schedule was worked out when the clip was synthesized. Clips cached before
+                # that play without lights this time and get analyzed on the pool for next time
+                pins = TALKING_LIGHTS[self.talking_lights]
+                schedule = self.light_schedules.get(key)
+                if schedule is None:
+                    self.speech_pool.analyze_cached(key, clip)
+                    await self.player.play(clip)
+                else:
+                    await self.player.play(clip, lambda: self.flash_lights(pins, schedule))
 
         return execute_say()
 
@@ -124,7 +298,37 @@ class Robot:
         await asyncio.sleep(duration)
         self.locomote(0, 0)
 
+    async def stop(self):
+        self.drive.stop()
+
+    async def stop_tasks(self):
+        # Background tasks have to be cancelled while the event loop is still running
+        tasks = [task for task in (self.drive.close(), self.servo_scheduler.stop()) if task is not None]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
     def shutdown(self):
+        print('Speech cache: %d hits, %d misses, %d evictions' % (
+                self.speech_cache.hits, self.speech_cache.misses, self.speech_cache.evictions))
+        print('Speech playback start latency: %s' % self.player.latency_summary())
+        self.player.close()
+        self.speech_pool.shutdown()
+        self.speech_cache.save()
+        self.motor.close()
+        print('Motor commands: %d sent, %d superseded, %d suppressed' % (
+                self.motor.sent, self.motor.superseded, self.motor.suppressed))
+        print('Motor link: %d bytes written, %d bytes queued, %d stalls for %.3fs' % (
+                self.driver_link.bytes_written, self.driver_link.bytes_queued,
+                self.driver_link.stalls, self.driver_link.stall_time))
+        latency = self.driver_supervisor.latency_percentiles()
+        print('Motor link latency: %s, watchdog tripped %d times' % (
+                ', '.join('p%d=%.1fms' % (p, 1000 * latency[p]) for p in sorted(latency)) or 'no responses',
+                self.driver_supervisor.trips))
+        self.driver_supervisor.close()
+        self.driver_link.abort()
+        print('PCA9685 channel writes: %d issued, %d elided' % (self.pca.writes_issued, self.pca.writes_elided))
+        print('PCA9685 bus lock wait: %s' % self.pca.i2c_device.lock_stats.wait)
+        print('PCA9685 bus lock hold: %s' % self.pca.i2c_device.lock_stats.hold)
+        self.bus.close()
         self.pca.deinit()
         GPIO.output(GPIO_MOTOR, GPIO.LOW)
         GPIO.cleanup()
@@ -140,8 +344,15 @@ if __name__ == '__main__':
     # Check for a program file argument (if there is one, don't load all the other control mechanisms)
     if len(sys.argv) == 2:
         with open(sys.argv[1], 'r') as program:
-            lines = [line.strip().lower() for line in program]
-            [robot.enqueue(action) for action in commands.process_program(lines, robot)]
+            lines = [line.strip() for line in program]
+
+        # Pre-flight: get all of the program's speech ready before it starts running
+        utterances = commands.utterances(lines)
+        misses, failures, elapsed = loop.run_until_complete(robot.prepare_speech(utterances))
+        print('Prepared %d utterances (%d synthesized, %d failed) in %.2fs' % (
+                len(utterances), misses - failures, failures, elapsed))
+
+        [robot.enqueue(action) for action in commands.process_program(lines, robot)]
     else:
         # Start the telnet control server
         control_server = ControlServer(robot)
@@ -158,15 +369,16 @@ if __name__ == '__main__':
 
     # Initialize the robot's main command processing loop
     consumer = asyncio.ensure_future(robot.consume_queue())
+    async def loop_shutdown():
+        consumer.cancel()
+        await robot.stop_tasks()
     try:
         loop.run_forever()
     except KeyboardInterrupt:
         print()
         print('Shutting down...')
-        async def loop_shutdown():
-            consumer.cancel()
-        loop.run_until_complete(loop_shutdown())
     finally:
+        loop.run_until_complete(loop_shutdown())
         loop.close()
         robot.shutdown()
 
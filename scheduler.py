@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+
+class ServoScheduler(object):
+    """Drives every active servo trajectory from a single task that ticks once per PWM frame.
+
+    Each tick samples all running trajectories, stages the results in one PCA9685 frame and
+    hands the commit to the bus worker. A servo updated more often than the PWM frequency would
+    never show the extra positions anyway.
+
+    Each servo is owned by at most one trajectory. Running a new one on a servo preempts the old
+    one, whose future resolves to False instead of True.
+    """
+
+    def __init__(self, pca, bus, loop=None):
+        self.pca = pca
+        self.bus = bus
+        self.loop = loop or asyncio.get_event_loop()
+        self.active = {}
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+        self.ticks = 0
+        self.overruns = 0
+        self.preempted = 0
+
+    def run(self, servo, trajectory):
+        # Returns a future that resolves once the trajectory has been written out in full
+        future = self.loop.create_future()
+        if servo in self.active:
+            self.preempted += 1
+            self.resolve(self.active[servo][2], False)
+        self.active[servo] = (trajectory, time.monotonic(), future)
+        self.wakeup.set()
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.tick_loop())
+        return future
+
+    async def tick_loop(self):
+        next_tick = time.monotonic()
+        while True:
+            if not self.active:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                next_tick = time.monotonic()
+
+            now = time.monotonic()
+            finished = []
+            failed = []
+            with self.pca.frame(commit=False):
+                for servo, (trajectory, start, future) in self.active.items():
+                    try:
+                        servo.angle = trajectory.position(now - start)
+                    except ValueError as e:
+                        failed.append((servo, e))
+                        continue
+                    if trajectory.done(now - start):
+                        finished.append(servo)
+            for servo, e in failed:
+                self.resolve(self.active.pop(servo)[2], exception=e)
+            finished = [self.active.pop(servo)[2] for servo in finished]
+
+            try:
+                await self.bus.submit(self.pca.commit, key=self.pca)
+            except OSError as e:
+                # The bus went away underneath us, fail every move that was depending on it
+                for future in finished + [entry[2] for entry in self.active.values()]:
+                    self.resolve(future, exception=e)
+                self.active.clear()
+                continue
+            self.ticks += 1
+            for future in finished:
+                self.resolve(future, True)
+
+            # Stay aligned to the PWM frame; if a tick ran long, skip the frames it missed
+            next_tick += 1 / self.pca.frequency
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                self.overruns += 1
+                next_tick = time.monotonic()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def resolve(future, result=None, exception=None):
+        if future.done():
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def stop(self):
+        # Returns the cancelled task, which has to be awaited before the event loop closes
+        task, self.task = self.task, None
+        if task is not None:
+            task.cancel()
+        return task
@@ -19,14 +19,19 @@ class ControlServer(object):
             line = await reader.readline()
             if line == b'':
                 break
-            command = line.decode('utf8').strip().lower()
+            command = line.decode('utf8').strip()
             try:
-                self.robot.enqueue(commands.parse(command, self.robot))
+                actions = commands.parse(command, self.robot)
             except SyntaxError as e:
                 print('<telnet> Not queued due to error:', command)
                 writer.write(b'Error: %s\r\n' % str(e).encode('ascii'))
             else:
-                print('<telnet> Queued:', command)
+                if commands.is_motion(command):
+                    self.robot.perform(actions)
+                    print('<telnet> Started:', command)
+                else:
+                    self.robot.enqueue(actions)
+                    print('<telnet> Queued:', command)
             writer.write(b'>> ')
 
     def shutdown(self):
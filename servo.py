@@ -1,16 +1,60 @@
-from adafruit_motor.servo import Servo
+class Servo(object):
+    """A servo on a PCA9685 channel, driven from a table of precomputed register values.
 
-class InvertedServo(Servo):
-    def __init__(self, pwm_out, actuation_range=180, min_pulse=750, max_pulse=2250):
-        super().__init__(pwm_out, actuation_range=actuation_range, min_pulse=min_pulse, max_pulse=max_pulse)
+    The table holds the final 12 bit (on, off) counts for every angle step of the given
+    resolution, computed once from the pulse range the same way adafruit_motor and PWMChannel do,
+    so setting an angle is a single lookup.
+    """
+
+    def __init__(self, pwm_out, actuation_range=180, min_pulse=750, max_pulse=2250, resolution=0.1, inverted=False):
+        self.pwm_out = pwm_out
+        self.actuation_range = actuation_range
+        self.resolution = resolution
+        self.inverted = inverted
+
+        frequency = pwm_out.frequency
+        self._min_duty = int((min_pulse * frequency) / 1000000 * 0xffff)
+        max_duty = (max_pulse * frequency) / 1000000 * 0xffff
+        self._duty_range = int(max_duty - self._min_duty)
+
+        steps = int(round(actuation_range / resolution))
+        self._steps_per_degree = steps / actuation_range
+        self._table = []
+        for step in range(steps + 1):
+            fraction = step / steps
+            if inverted:
+                fraction = 1 - fraction
+            duty_cycle = self._min_duty + int(fraction * self._duty_range)
+            # The PCA9685 is only 12 bits, PWMChannel rounds the 16 bit duty cycle down the same way
+            self._table.append((0, (duty_cycle + 1) >> 4))
 
-    _angle = Servo.angle
+        self._angle = self._decode(pwm_out.counts)
+
+    def _decode(self, counts):
+        # Recover the angle from the counts the channel holds, or None if it isn't driving a pulse
+        on, off = counts
+        if on & 0x1000 or off & 0x1000 or not off:
+            return None
+        # Table values were rounded down to 12 bits, so the ends of the range can read back a
+        # fraction of a degree beyond it
+        fraction = min(max(((off << 4) - self._min_duty) / self._duty_range, 0.0), 1.0)
+        if self.inverted:
+            fraction = 1 - fraction
+        return self.actuation_range * fraction
 
     @property
     def angle(self):
-        return 180 - self._angle
+        return self._angle
 
     @angle.setter
     def angle(self, value):
-        self._angle = 180 - value
+        if not 0 <= value <= self.actuation_range:
+            raise ValueError('Angle out of range')
+        self.pwm_out.counts = self._table[int(value * self._steps_per_degree + 0.5)]
+        self._angle = value
+
 
+class InvertedServo(Servo):
+    def __init__(self, pwm_out, actuation_range=180, min_pulse=750, max_pulse=2250, resolution=0.1):
+        super().__init__(pwm_out, actuation_range=actuation_range, min_pulse=min_pulse, max_pulse=max_pulse,
+                resolution=resolution, inverted=True)
@@ -0,0 +1,354 @@
+import hashlib
+import json
+import mmap
+import os
+import re
+import subprocess
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from audio import wav_pcm
+
+
+sentence_end = re.compile(r'(?<=[.!?])\s+')
+clause_end = re.compile(r'(?<=[,;:])\s+')
+
+
+def split_utterance(text, max_length=80):
+    # Break text into sentences, and sentences longer than max_length into clauses, so each
+    # piece can be synthesized on its own and played as soon as it is ready
+    chunks = []
+    for sentence in sentence_end.split(text.strip()):
+        if len(sentence) <= max_length:
+            chunks.append(sentence)
+            continue
+        clause = ''
+        for part in clause_end.split(sentence):
+            if clause and len(clause) + 1 + len(part) > max_length:
+                chunks.append(clause)
+                clause = part
+            else:
+                clause = '%s %s' % (clause, part) if clause else part
+        chunks.append(clause)
+    return [chunk for chunk in chunks if chunk]
+
+
+def clip_key(*parts):
+    return hashlib.sha1('\0'.join(parts).encode('utf8')).hexdigest()
+
+
+class Synthesizer(ABC):
+    """Turns text into audio.
+
+    synthesize() is a blocking call that returns the audio as bytes, either MP3 data or raw 16 bit
+    mono PCM at sample_rate, as given by encoding. identity is a tuple of strings describing
+    everything besides the text that determines the audio, for use in cache keys.
+    """
+
+    encoding = 'pcm'
+    sample_rate = 24000
+    identity = ()
+
+    @abstractmethod
+    def synthesize(self, text):
+        pass
+
+
+class GoogleSynthesizer(Synthesizer):
+    """Google Cloud Text-to-Speech, as MP3 or (with pcm set) LINEAR16 audio."""
+
+    def __init__(self, voice='en-US-Wavenet-F', language_code='en-US', pcm=False, sample_rate=24000):
+        from google.cloud import texttospeech
+        self.texttospeech = texttospeech
+        self.client = texttospeech.TextToSpeechClient()
+        self.voice = texttospeech.types.VoiceSelectionParams(language_code=language_code, name=voice)
+        if pcm:
+            self.encoding = 'pcm'
+            self.sample_rate = sample_rate
+            self.audio_config = texttospeech.types.AudioConfig(
+                    audio_encoding=texttospeech.enums.AudioEncoding.LINEAR16, sample_rate_hertz=sample_rate)
+        else:
+            self.encoding = 'mp3'
+            self.audio_config = texttospeech.types.AudioConfig(audio_encoding=texttospeech.enums.AudioEncoding.MP3)
+        self.identity = (str(self.voice), str(self.audio_config))
+
+    def synthesize(self, text):
+        speech_input = self.texttospeech.types.SynthesisInput(text=text)
+        response = self.client.synthesize_speech(speech_input, self.voice, self.audio_config)
+        if self.encoding == 'pcm':
+            # LINEAR16 comes wrapped in a WAV header, only the samples get cached
+            return wav_pcm(response.audio_content)
+        return response.audio_content
+
+
+class EspeakSynthesizer(Synthesizer):
+    """The local espeak engine, which needs no network at all."""
+
+    sample_rate = 22050
+
+    def __init__(self, voice='en-us', executable='/usr/bin/espeak'):
+        self.voice = voice
+        self.executable = executable
+        self.identity = ('espeak', voice)
+
+    def synthesize(self, text):
+        result = subprocess.run([self.executable, '--stdout', '-v', self.voice, text], stdout=subprocess.PIPE, check=True)
+        return wav_pcm(result.stdout)
+
+
+class SilenceSynthesizer(Synthesizer):
+    """Deterministic offline stand-in that "speaks" silence, seconds_per_character long per
+    character of text."""
+
+    sample_rate = 16000
+
+    def __init__(self, seconds_per_character=0.06):
+        self.seconds_per_character = seconds_per_character
+        self.identity = ('silence', repr(seconds_per_character))
+
+    def synthesize(self, text):
+        return bytes(2 * int(self.sample_rate * self.seconds_per_character * len(text)))
+
+
+synthesizers = {
+    'google': GoogleSynthesizer,
+    'espeak': EspeakSynthesizer,
+    'silence': SilenceSynthesizer,
+}
+
+
+class SpeechCache(object):
+    """Content-addressed on-disk cache of synthesized speech clips.
+
+    Clips are keyed by a hash of everything that determines the audio (the text, the voice and
+    the audio configuration). The cache keeps its total size under max_bytes by evicting the
+    least recently used clips, and persists its index (in LRU order) so it survives restarts.
+    It is safe to use from several threads.
+    """
+
+    def __init__(self, directory='/tmp/speech-cache', max_bytes=64 * 1024 * 1024, extension='mp3'):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self.index_path = os.path.join(directory, 'index.json')
+        self.lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # Index of key -> clip size in bytes, least recently used first
+        self.index = OrderedDict()
+        try:
+            with open(self.index_path, 'r') as index:
+                entries = json.load(index)
+        except (OSError, ValueError):
+            entries = []
+        for key, size in entries:
+            if os.path.exists(self.path(key)):
+                self.index[key] = size
+        self.size = sum(self.index.values())
+
+    key = staticmethod(clip_key)
+
+    def path(self, key):
+        return os.path.join(self.directory, '%s.%s' % (key, self.extension))
+
+    def get(self, key):
+        # Returns the path of the cached clip, or None on a miss
+        with self.lock:
+            if key not in self.index:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.index.move_to_end(key)
+            return self.path(key)
+
+    def put(self, key, data):
+        path = self.path(key)
+        # Write to a temporary file first so a half-written clip is never picked up
+        temporary = '%s.%d.tmp' % (path, threading.get_ident())
+        with open(temporary, 'wb') as out:
+            out.write(data)
+        os.replace(temporary, path)
+
+        with self.lock:
+            self.size += len(data) - self.index.pop(key, 0)
+            self.index[key] = len(data)
+            while self.size > self.max_bytes and len(self.index) > 1:
+                evicted, size = self.index.popitem(last=False)
+                self.size -= size
+                self.evictions += 1
+                try:
+                    os.remove(self.path(evicted))
+                except OSError:
+                    pass
+            self.save()
+        return path
+
+    def save(self):
+        with self.lock:
+            with open(self.index_path + '.tmp', 'w') as index:
+                json.dump(list(self.index.items()), index)
+            os.replace(self.index_path + '.tmp', self.index_path)
+
+
+class PackedClipCache(object):
+    """Speech clips packed back to back into one memory-mapped file.
+
+    Meant for raw PCM clips that can go straight to the audio device: get() returns a memoryview
+    slice of the mapping, so playing a cached clip needs neither a decode step nor a copy. The
+    index of key -> (offset, length) is persisted next to the pack. When the pack would grow
+    past max_bytes, it is rewritten keeping only the most recently used clips that fit in half
+    of it. Clips that are still being played keep the old mapping alive until they finish.
+    on_compact, if set, is called with the keys that are left after every compaction.
+    """
+
+    def __init__(self, directory='/tmp/speech-cache', max_bytes=64 * 1024 * 1024, name='speech.pcm', on_compact=None):
+        self.pack_path = os.path.join(directory, name)
+        self.index_path = os.path.join(directory, name + '.json')
+        self.max_bytes = max_bytes
+        self.on_compact = on_compact
+        self.lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # Index of key -> (offset, length) in the pack, least recently used first
+        self.index = OrderedDict()
+        try:
+            with open(self.index_path, 'r') as index:
+                entries = json.load(index)
+        except (OSError, ValueError):
+            entries = []
+        # put() appends to the pack, so the size has to be the file's whatever the index says
+        try:
+            self.size = os.path.getsize(self.pack_path)
+        except OSError:
+            self.size = 0
+        for key, offset, length in entries:
+            if offset + length <= self.size:
+                self.index[key] = (offset, length)
+        self.remap()
+
+    key = staticmethod(clip_key)
+
+    def remap(self):
+        self.view = None
+        if self.size:
+            with open(self.pack_path, 'rb') as pack:
+                self.view = memoryview(mmap.mmap(pack.fileno(), self.size, access=mmap.ACCESS_READ))
+
+    def get(self, key):
+        # Returns the cached clip as a memoryview, or None on a miss
+        with self.lock:
+            if key not in self.index:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.index.move_to_end(key)
+            offset, length = self.index[key]
+            return self.view[offset:offset + length]
+
+    def put(self, key, data):
+        with self.lock:
+            if key in self.index:
+                offset, length = self.index[key]
+                return self.view[offset:offset + length]
+            if self.size + len(data) > self.max_bytes:
+                self.compact((self.max_bytes - len(data)) // 2)
+            with open(self.pack_path, 'ab') as pack:
+                pack.write(data)
+            self.index[key] = (self.size, len(data))
+            self.size += len(data)
+            self.remap()
+            self.save()
+            return self.view[self.size - len(data):self.size]
+
+    def compact(self, budget):
+        # Keep the most recently used clips that fit in the budget, in their LRU order
+        keep = []
+        total = 0
+        for key in reversed(self.index):
+            length = self.index[key][1]
+            if total + length > budget:
+                break
+            keep.insert(0, key)
+            total += length
+
+        index = OrderedDict()
+        with open(self.pack_path + '.tmp', 'wb') as pack:
+            for key in keep:
+                offset, length = self.index[key]
+                index[key] = (pack.tell(), length)
+                pack.write(self.view[offset:offset + length])
+        # Replacing the file (rather than rewriting it in place) leaves the old mapping intact
+        os.replace(self.pack_path + '.tmp', self.pack_path)
+        self.evictions += len(self.index) - len(index)
+        self.index = index
+        self.size = total
+        self.remap()
+        if self.on_compact is not None:
+            self.on_compact(set(index))
+
+    def save(self):
+        with self.lock:
+            with open(self.index_path + '.tmp', 'w') as index:
+                json.dump([(key, offset, length) for key, (offset, length) in self.index.items()], index)
+            os.replace(self.index_path + '.tmp', self.index_path)
+
+
+class SpeechPool(object):
+    """Synthesizes speech clips into a SpeechCache or PackedClipCache on a bounded thread pool.
+
+    synthesize is a blocking callable that turns text into audio bytes. Submitting a clip returns
+    a concurrent future for the clip as the cache hands it out (a path or a memoryview); clips
+    that are already cached resolve at once, and a clip that is already being synthesized
+    shares the future of that work. An optional analyze(key, clip) callable runs on the same
+    thread once a new clip is cached.
+    """
+
+    def __init__(self, cache, synthesize, workers=4, analyze=None):
+        self.cache = cache
+        self.synthesize = synthesize
+        self.analyze = analyze
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='speech')
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+    def submit(self, key, text):
+        with self.lock:
+            if key in self.in_flight:
+                return self.in_flight[key]
+            clip = self.cache.get(key)
+            if clip is not None:
+                future = Future()
+                future.set_result(clip)
+                return future
+            future = self.executor.submit(self.fetch, key, text)
+            self.in_flight[key] = future
+        future.add_done_callback(lambda _: self.finished(key))
+        return future
+
+    def fetch(self, key, text):
+        clip = self.cache.put(key, self.synthesize(text))
+        if self.analyze is not None:
+            self.analyze(key, clip)
+        return clip
+
+    def analyze_cached(self, key, clip):
+        # Runs analyze on the pool for a clip that was cached before analysis was set up
+        if self.analyze is not None:
+            self.executor.submit(self.analyze, key, clip)
+
+    def finished(self, key):
+        with self.lock:
+            self.in_flight.pop(key, None)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
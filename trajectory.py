@@ -0,0 +1,62 @@
+PROFILES = ('trapezoid', 'minimum_jerk')
+
+
+class Trajectory(object):
+    """A point-to-point move from start to end, sampled by time since the move began.
+
+    The move takes either the given duration, or the shortest time that keeps its peak speed
+    within max_speed (in units per second). The trapezoid profile ramps speed up and down at a
+    constant acceleration over accel_fraction of the move at each end; the minimum_jerk profile
+    is the smooth quintic that has zero velocity and acceleration at both ends.
+    """
+
+    def __init__(self, start, end, duration=None, max_speed=None, profile='trapezoid', accel_fraction=0.25):
+        if profile not in PROFILES:
+            raise ValueError('Unknown trajectory profile: %s' % profile)
+        if duration is None and max_speed is None:
+            raise ValueError('A trajectory needs a duration or a maximum speed')
+        if not 0 < accel_fraction <= 0.5:
+            raise ValueError('Acceleration fraction must be in (0, 0.5]')
+
+        self.start = start
+        self.end = end
+        self.distance = end - start
+        self.profile = profile
+        self.accel_fraction = accel_fraction
+
+        if duration is None:
+            # Pick the duration whose peak speed is exactly max_speed
+            if profile == 'trapezoid':
+                duration = abs(self.distance) / (max_speed * (1 - accel_fraction))
+            else:
+                duration = 1.875 * abs(self.distance) / max_speed
+        self.duration = duration
+
+    def fraction(self, t):
+        # Fraction of the distance covered after t seconds
+        if t <= 0:
+            return 0.0
+        if t >= self.duration:
+            return 1.0
+        tau = t / self.duration
+        if self.profile == 'minimum_jerk':
+            return tau ** 3 * (10 - 15 * tau + 6 * tau * tau)
+
+        ramp = self.accel_fraction
+        peak = 1 / (1 - ramp)
+        if tau < ramp:
+            return 0.5 * peak * tau * tau / ramp
+        elif tau <= 1 - ramp:
+            return peak * (tau - 0.5 * ramp)
+        else:
+            return 1 - 0.5 * peak * (1 - tau) ** 2 / ramp
+
+    def position(self, t):
+        return self.start + self.distance * self.fraction(t)
+
+    def done(self, t):
+        return t >= self.duration
+
+    def __repr__(self):
+        return 'Trajectory(%g -> %g in %.3fs, %s)' % (self.start, self.end, self.duration, self.profile)
+